@@ -1,92 +1,323 @@
 """Convert MOV files to MP4 and rename them with the creation date as YYYYMMDD"""
 
 import argparse
+import asyncio
+import contextlib
+import functools
 import os
+import subprocess
 from datetime import datetime
 from pathlib import Path
 
 import ffmpeg
 from tqdm import tqdm
 
+# Number of ffmpeg threads given to each conversion when running several in parallel
+THREADS_PER_JOB = 2
 
-def convert_file(input_path: str, output_path: str):
-    """Convert a single MOV file to MP4 and rename it with the creation date as YYYYMMDD"""
+# Number of conversions run in parallel on a hardware encoder. A GPU has a single encoder
+# block, and consumer NVIDIA drivers cap the number of concurrent NVENC sessions.
+HARDWARE_JOBS = 2
+
+# Output options for each supported H.264 encoder, tuned for roughly equivalent quality.
+# Hardware encoders are pinned to 8-bit 4:2:0 since they reject 10-bit (e.g. iPhone HDR) input.
+# NVENC defaults to a 2 Mb/s target that would cap cq, so the bitrate is cleared; QSV picks
+# ICQ mode from global_quality, which ignores the bitrate.
+ENCODER_OPTIONS = {
+    "libx264": {"crf": 18, "preset": "slow"},
+    "h264_nvenc": {
+        "preset": "p5",
+        "rc": "vbr",
+        "cq": 20,
+        "b:v": 0,
+        "pix_fmt": "yuv420p",
+    },
+    "h264_videotoolbox": {"q:v": 55, "pix_fmt": "yuv420p"},
+    "h264_qsv": {"preset": "slow", "global_quality": 20, "pix_fmt": "yuv420p"},
+}
+
+# Hardware encoders in order of preference; libx264 is the software fallback
+HARDWARE_ENCODERS = ("h264_nvenc", "h264_videotoolbox", "h264_qsv")
+
+
+def encoder_works(encoder: str):
+    """Check that an encoder can encode with the options used for real conversions
+
+    Being listed by `ffmpeg -encoders` only means ffmpeg was built with it, and some builds
+    reject particular options (e.g. q:v for h264_videotoolbox on Intel Macs).
+    """
+
+    try:
+        (
+            ffmpeg.input("color=black:s=256x256:d=0.1", f="lavfi")
+            .output("-", vcodec=encoder, f="null", **ENCODER_OPTIONS[encoder])
+            .run(quiet=True)
+        )
+    except (ffmpeg.Error, OSError):
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def detect_encoder():
+    """Get the fastest usable H.264 encoder, falling back to libx264"""
+
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "libx264"
+
+    available = {
+        line.split()[1] for line in result.stdout.splitlines() if len(line.split()) > 1
+    }
+    for encoder in HARDWARE_ENCODERS:
+        if encoder in available and encoder_works(encoder):
+            return encoder
+    return "libx264"
+
+
+def default_max_workers(encoder: str):
+    """Get the default number of parallel conversions for an encoder"""
+
+    if encoder == "libx264":
+        return max(1, (os.cpu_count() or 1) // THREADS_PER_JOB)
+    return HARDWARE_JOBS
+
+
+def remove_file(path: str):
+    """Remove a file if it exists"""
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+async def convert_file_async(
+    input_path: str,
+    output_path: str,
+    encoder: str = None,
+    threads: int = 0,
+    show_progress: bool = True,
+):
+    """Convert a single MOV file to MP4 and rename it with the creation date as YYYYMMDD
+
+    encoder is one of ENCODER_OPTIONS and defaults to the one picked by detect_encoder.
+    threads caps the number of ffmpeg threads (0 lets ffmpeg decide), and show_progress
+    toggles the per-file progress bar, which is disabled when converting files in parallel.
+    """
+
+    if encoder is None:
+        encoder = detect_encoder()
 
     try:
         # Convert .mov to .mp4 using ffmpeg
-        probe = ffmpeg.probe(input_path)
+        probe = await asyncio.to_thread(ffmpeg.probe, input_path)
         duration = float(probe["streams"][0]["duration"])
+    except ffmpeg.Error as e:
+        print(f"Error converting {input_path}: {e.stderr.decode()}")
+        return None
+    except (KeyError, IndexError, ValueError):
+        print(f"Error converting {input_path}: could not read the video duration")
+        return None
 
-        # Run the ffmpeg command
-        process = (
-            ffmpeg.input(input_path)
-            .output(output_path, vcodec="libx264", acodec="aac", crf=18, preset="slow")
-            .global_args("-progress", "pipe:1")
-            .overwrite_output()
-            .run_async(pipe_stdout=True, pipe_stderr=True)
+    # Run the ffmpeg command
+    args = (
+        ffmpeg.input(input_path)
+        .output(
+            output_path,
+            vcodec=encoder,
+            acodec="aac",
+            threads=threads,
+            **ENCODER_OPTIONS[encoder],
         )
+        .global_args("-progress", "pipe:1")
+        .overwrite_output()
+        .compile()
+    )
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    # Drain stderr alongside stdout so ffmpeg never blocks on a full pipe
+    stderr = asyncio.create_task(process.stderr.read())
 
-        # Initialize the progress bar
-        pbar = tqdm(total=100, position=1, bar_format="{l_bar}{bar}", ncols=50)
-
-        while True:
-            line = process.stdout.readline().decode("utf-8")
-            if not line:
-                break
+    # Initialize the progress bar
+    pbar = tqdm(
+        total=100,
+        position=1,
+        bar_format="{l_bar}{bar}",
+        ncols=50,
+        disable=not show_progress,
+    )
 
+    try:
+        async for line in process.stdout:
             # Update the progress bar
-            parts = line.split("=")
+            parts = line.decode("utf-8").split("=")
             # Check if the line contains the progress information
             if len(parts) == 2 and parts[0] == "out_time_ms":
-                time = float(parts[1]) / 1000000
+                try:
+                    time = float(parts[1]) / 1000000
+                except ValueError:
+                    # ffmpeg reports N/A until the first packet has been written
+                    continue
                 # Calculate the progress percentage
                 progress = min(int(time / duration * 100), 100)
                 pbar.n = progress
                 pbar.refresh()
 
+        returncode = await process.wait()
+    except BaseException:
+        # Cancelled or failed mid-encode: stop ffmpeg and drop the truncated output
+        if process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
+        stderr.cancel()
+        remove_file(output_path)
+        raise
+    finally:
         pbar.close()
-        process.wait()
-        return output_path
-    except ffmpeg.Error as e:
-        print(f"Error converting {input_path}: {e.stderr.decode()}")
+
+    if returncode != 0:
+        print(f"Error converting {input_path}: {(await stderr).decode()}")
+        remove_file(output_path)
         return None
+    await stderr
+    return output_path
+
+
+def convert_file(
+    input_path: str,
+    output_path: str,
+    encoder: str = None,
+    threads: int = 0,
+    show_progress: bool = True,
+):
+    """Convert a single MOV file to MP4, blocking until ffmpeg finishes"""
+
+    return asyncio.run(
+        convert_file_async(
+            input_path=input_path,
+            output_path=output_path,
+            encoder=encoder,
+            threads=threads,
+            show_progress=show_progress,
+        )
+    )
 
 
 def get_file_creation_date(input_path: str):
-    """Get the creation date of a file as YYYYMMDD"""
+    """Get the creation date of a file as YYYYMMDD
+
+    Uses the birth time where os.stat exposes it (macOS, BSD, and Windows on Python 3.12+)
+    and falls back to the modification time elsewhere, e.g. on Linux.
+    """
 
-    return datetime.fromtimestamp(os.path.getmtime(input_path)).strftime("%Y%m%d")
+    st = os.stat(input_path)
+    created = getattr(st, "st_birthtime", st.st_mtime)
+
+    return datetime.fromtimestamp(created).strftime("%Y%m%d")
 
 
 def get_output_filepath(input_path: str):
     """Get the output filepath for a file"""
 
-    file_dir = Path(input_path).parent
-    file_name = Path(input_path).stem
-    yyyymmdd = get_file_creation_date(input_path=input_path)
+    path = Path(input_path)
+    yyyymmdd = get_file_creation_date(input_path=str(path))
+
+    return str(path.with_name(f"{yyyymmdd}_{path.stem}.mp4"))
+
+
+async def convert_files_async(pairs, max_workers: int, encoder: str):
+    """Convert (input, output) pairs concurrently, with at most max_workers ffmpeg processes"""
+
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def convert(input_path, output_path):
+        async with semaphore:
+            # Report a failed file and carry on, so one bad input never cancels the others
+            try:
+                converted_file = await convert_file_async(
+                    input_path=input_path,
+                    output_path=output_path,
+                    encoder=encoder,
+                    threads=THREADS_PER_JOB,
+                    show_progress=False,
+                )
+            except Exception as e:
+                print(f"Error converting {input_path}: {e}")
+                converted_file = None
+        return input_path, converted_file
+
+    with tqdm(total=len(pairs), unit="file") as pbar:
+        for task in asyncio.as_completed(
+            [convert(input_path, output_path) for input_path, output_path in pairs]
+        ):
+            input_path, converted_file = await task
+            if converted_file:
+                pbar.write(
+                    f"Successfully converted and renamed: {os.path.basename(input_path)} -> {converted_file}"
+                )
+            pbar.update(1)
+
+
+def positive_int(value: str):
+    """Parse a command line value as an integer of at least 1"""
 
-    return str(file_dir / f"{yyyymmdd}_{Path(file_name).with_suffix('.mp4')}")
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
-def convert_and_rename_mov_files(input_directory):
-    """Convert all .mov files in the input directory to .mp4 and rename them with the creation date as YYYYMMDD"""
+def convert_and_rename_mov_files(
+    input_directory, max_workers: int = None, encoder: str = None
+):
+    """Convert all .mov files in the input directory to .mp4 and rename them with the creation date as YYYYMMDD
+
+    Up to max_workers ffmpeg processes run at once, defaulting to one job per
+    THREADS_PER_JOB cores for libx264 and HARDWARE_JOBS for hardware encoders.
+    """
 
     if not os.path.exists(input_directory):
         print(f"Error: Directory '{input_directory}' does not exist.")
         return
 
-    # Iterate through all files in the input directory
-    for filename in os.listdir(input_directory):
-        if filename.lower().endswith(".mov"):
-            input_path = os.path.join(input_directory, filename)
-            output_path = get_output_filepath(input_path=input_path)
-            converted_file = convert_file(
-                input_path=input_path, output_path=output_path
-            )
-            if converted_file:
-                print(
-                    f"Successfully converted and renamed: {filename} -> {converted_file}"
-                )
+    if max_workers is not None and max_workers < 1:
+        print(f"Error: max_workers must be at least 1, got {max_workers}.")
+        return
+
+    # Collect (input, output) pairs for all .mov files in the input directory. Inputs that
+    # differ only in extension case (clip.mov, clip.MOV) map to the same output, and
+    # converting both at once would have two ffmpeg processes writing the same file.
+    pairs = []
+    outputs = {}
+    with os.scandir(input_directory) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.name.lower().endswith(".mov") and entry.is_file():
+                output_path = get_output_filepath(input_path=entry.path)
+                key = os.path.normcase(output_path)
+                if key in outputs:
+                    print(
+                        f"Error: skipping {entry.name}, {output_path} is already the output of {outputs[key]}"
+                    )
+                    continue
+                outputs[key] = entry.name
+                pairs.append((entry.path, output_path))
+
+    if not pairs:
+        return
+
+    if encoder is None:
+        encoder = detect_encoder()
+    if max_workers is None:
+        max_workers = default_max_workers(encoder)
+
+    asyncio.run(convert_files_async(pairs, max_workers=max_workers, encoder=encoder))
 
 
 if __name__ == "__main__":
@@ -95,15 +326,34 @@ if __name__ == "__main__":
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--dir", help="Directory containing MOV files to convert")
     group.add_argument("--file", help="Single MOV file to convert")
+    parser.add_argument(
+        "--jobs",
+        type=positive_int,
+        default=None,
+        help=(
+            "Number of conversions to run in parallel with --dir "
+            f"(default: CPU count / {THREADS_PER_JOB} for libx264, "
+            f"{HARDWARE_JOBS} for hardware encoders)"
+        ),
+    )
+    parser.add_argument(
+        "--encoder",
+        choices=["auto", *ENCODER_OPTIONS],
+        default="auto",
+        help="H.264 encoder to use (default: auto-detect a hardware encoder, else libx264)",
+    )
     args = parser.parse_args()
+    encoder = None if args.encoder == "auto" else args.encoder
 
     if args.dir:
-        convert_and_rename_mov_files(args.dir)
+        convert_and_rename_mov_files(args.dir, max_workers=args.jobs, encoder=encoder)
     elif args.file:
         if args.file.lower().endswith(".mov"):
 
             output_path = get_output_filepath(input_path=args.file)
-            converted_file = convert_file(input_path=args.file, output_path=output_path)
+            converted_file = convert_file(
+                input_path=args.file, output_path=output_path, encoder=encoder
+            )
             if converted_file:
                 print(
                     f"Successfully converted and renamed: {args.file} -> {converted_file}"
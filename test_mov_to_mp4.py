@@ -1,9 +1,22 @@
+import asyncio
 import os
+import subprocess
 from datetime import datetime
+from types import SimpleNamespace
 
+import pytest
+
+import mov_to_mp4
 from mov_to_mp4 import get_file_creation_date, get_output_filepath
 
 
+@pytest.fixture(autouse=True)
+def clear_detected_encoder():
+    mov_to_mp4.detect_encoder.cache_clear()
+    yield
+    mov_to_mp4.detect_encoder.cache_clear()
+
+
 def test_get_file_creation_date(tmp_path):
 
     test_file = tmp_path / "test_file.txt"
@@ -26,3 +39,278 @@ def test_get_output_filepath(tmp_path):
 
     expected_path = tmp_path / f"{file_creation_date}_test_file.mp4"
     assert result == str(expected_path)
+
+
+def test_detect_encoder_prefers_working_hardware_encoder(monkeypatch):
+    encoders = (
+        " V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC\n"
+        " V....D h264_nvenc           NVIDIA NVENC H.264 encoder\n"
+        " V....D h264_qsv             H.264 / AVC (Intel Quick Sync Video acceleration)\n"
+    )
+    monkeypatch.setattr(
+        subprocess,
+        "run",
+        lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, stdout=encoders),
+    )
+    # h264_nvenc is compiled in but there is no NVIDIA GPU to run it on
+    monkeypatch.setattr(
+        mov_to_mp4, "encoder_works", lambda encoder: encoder == "h264_qsv"
+    )
+
+    assert mov_to_mp4.detect_encoder() == "h264_qsv"
+
+
+def test_encoder_works_checks_conversion_options(monkeypatch):
+    calls = []
+
+    class FakeStream:
+        def output(self, *args, **kwargs):
+            calls.append(kwargs)
+            return self
+
+        def run(self, **kwargs):
+            raise mov_to_mp4.ffmpeg.Error("ffmpeg", b"", b"use -b:v instead")
+
+    monkeypatch.setattr(
+        mov_to_mp4.ffmpeg, "input", lambda *args, **kwargs: FakeStream()
+    )
+
+    assert mov_to_mp4.encoder_works("h264_videotoolbox") is False
+    assert calls[0]["vcodec"] == "h264_videotoolbox"
+    for key, value in mov_to_mp4.ENCODER_OPTIONS["h264_videotoolbox"].items():
+        assert calls[0][key] == value
+
+
+def test_detect_encoder_falls_back_to_libx264(monkeypatch):
+    def missing_ffmpeg(*args, **kwargs):
+        raise FileNotFoundError("ffmpeg")
+
+    monkeypatch.setattr(subprocess, "run", missing_ffmpeg)
+
+    assert mov_to_mp4.detect_encoder() == "libx264"
+
+
+def test_default_max_workers_limits_hardware_encoders(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+
+    assert mov_to_mp4.default_max_workers("libx264") == 16 // mov_to_mp4.THREADS_PER_JOB
+    for encoder in mov_to_mp4.HARDWARE_ENCODERS:
+        assert mov_to_mp4.default_max_workers(encoder) == mov_to_mp4.HARDWARE_JOBS
+
+
+def test_convert_and_rename_mov_files_runs_files_concurrently(tmp_path, monkeypatch):
+    for name in ["a.mov", "b.MOV", "c.mov", "d.mov", "bad.mov", "broken.mov"]:
+        (tmp_path / name).touch()
+    (tmp_path / "notes.txt").touch()
+    (tmp_path / "sub.mov").mkdir()
+
+    called = []
+    running = 0
+    peak = 0
+
+    async def fake_convert_file_async(input_path, output_path, **kwargs):
+        nonlocal running, peak
+        called.append(os.path.basename(input_path))
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if "broken" in input_path:
+            raise RuntimeError("ffmpeg exploded")
+        if "bad" in input_path:
+            return None
+        return output_path
+
+    monkeypatch.setattr(mov_to_mp4, "convert_file_async", fake_convert_file_async)
+
+    mov_to_mp4.convert_and_rename_mov_files(
+        str(tmp_path), max_workers=2, encoder="libx264"
+    )
+
+    assert sorted(called) == [
+        "a.mov",
+        "b.MOV",
+        "bad.mov",
+        "broken.mov",
+        "c.mov",
+        "d.mov",
+    ]
+    assert peak == 2
+
+
+def test_convert_and_rename_mov_files_skips_duplicate_outputs(tmp_path, monkeypatch):
+    (tmp_path / "clip.MOV").touch()
+    (tmp_path / "clip.mov").touch()
+    if len(os.listdir(tmp_path)) == 1:
+        pytest.skip("case-insensitive filesystem")
+
+    called = []
+
+    async def fake_convert_file_async(input_path, output_path, **kwargs):
+        called.append(output_path)
+        return output_path
+
+    monkeypatch.setattr(mov_to_mp4, "convert_file_async", fake_convert_file_async)
+
+    mov_to_mp4.convert_and_rename_mov_files(
+        str(tmp_path), max_workers=2, encoder="libx264"
+    )
+
+    assert len(called) == 1
+
+
+@pytest.mark.parametrize("max_workers", [0, -1])
+def test_convert_and_rename_mov_files_rejects_invalid_max_workers(
+    tmp_path, monkeypatch, capsys, max_workers
+):
+    (tmp_path / "clip.mov").touch()
+
+    async def fake_convert_file_async(input_path, output_path, **kwargs):
+        raise AssertionError("no conversion should start")
+
+    monkeypatch.setattr(mov_to_mp4, "convert_file_async", fake_convert_file_async)
+
+    mov_to_mp4.convert_and_rename_mov_files(
+        str(tmp_path), max_workers=max_workers, encoder="libx264"
+    )
+
+    assert "max_workers must be at least 1" in capsys.readouterr().out
+
+
+def test_convert_file_async_reports_missing_duration(tmp_path, monkeypatch, capsys):
+    test_file = tmp_path / "test_file.mov"
+    test_file.touch()
+    monkeypatch.setattr(mov_to_mp4.ffmpeg, "probe", lambda path: {"streams": [{}]})
+
+    result = mov_to_mp4.convert_file(
+        str(test_file), str(tmp_path / "out.mp4"), encoder="libx264"
+    )
+
+    assert result is None
+    assert "could not read the video duration" in capsys.readouterr().out
+
+
+def test_get_file_creation_date_prefers_birth_time(monkeypatch):
+    birthtime = datetime(2019, 5, 6, 12, 0).timestamp()
+    mtime = datetime(2020, 1, 2, 12, 0).timestamp()
+    monkeypatch.setattr(
+        os,
+        "stat",
+        lambda path: SimpleNamespace(st_birthtime=birthtime, st_mtime=mtime),
+    )
+
+    assert get_file_creation_date("test_file.mov") == "20190506"
+
+
+class FakeProcess:
+    """Stand-in for an asyncio ffmpeg subprocess that writes the output file"""
+
+    def __init__(self, args, stdout=b"", stderr=b"", returncode=0, hang=False):
+        self.output_path = next(arg for arg in args if arg.endswith(".mp4"))
+        with open(self.output_path, "wb") as f:
+            f.write(b"partial")
+        self.stdout = asyncio.StreamReader()
+        self.stdout.feed_data(stdout)
+        if not hang:
+            self.stdout.feed_eof()
+        self.stderr = asyncio.StreamReader()
+        self.stderr.feed_data(stderr)
+        self.stderr.feed_eof()
+        self.returncode = None
+        self.exit_code = returncode
+        self.killed = False
+
+    async def wait(self):
+        if self.returncode is None:
+            self.returncode = self.exit_code
+        return self.returncode
+
+    def kill(self):
+        self.killed = True
+        self.returncode = -9
+        self.stdout.feed_eof()
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """Patch ffprobe and ffmpeg, returning the processes started by each conversion"""
+
+    (tmp_path / "clip.mov").touch()
+    monkeypatch.setattr(
+        mov_to_mp4.ffmpeg, "probe", lambda path: {"streams": [{"duration": "2.0"}]}
+    )
+    processes = []
+
+    def patch(**kwargs):
+        async def create_subprocess_exec(*args, **_):
+            process = FakeProcess(args, **kwargs)
+            processes.append(process)
+            return process
+
+        monkeypatch.setattr(asyncio, "create_subprocess_exec", create_subprocess_exec)
+        return processes
+
+    return patch
+
+
+def convert_clip(tmp_path):
+    return mov_to_mp4.convert_file_async(
+        str(tmp_path / "clip.mov"),
+        str(tmp_path / "clip.mp4"),
+        encoder="libx264",
+        show_progress=False,
+    )
+
+
+def test_convert_file_async_succeeds_despite_unknown_progress(tmp_path, fake_ffmpeg):
+    fake_ffmpeg(stdout=b"out_time_ms=N/A\nout_time_ms=1000000\nprogress=end\n")
+
+    result = asyncio.run(convert_clip(tmp_path))
+
+    assert result == str(tmp_path / "clip.mp4")
+    assert (tmp_path / "clip.mp4").exists()
+
+
+def test_convert_file_async_removes_output_on_failure(tmp_path, fake_ffmpeg, capsys):
+    fake_ffmpeg(stderr=b"Invalid data found", returncode=1)
+
+    result = asyncio.run(convert_clip(tmp_path))
+
+    assert result is None
+    assert not (tmp_path / "clip.mp4").exists()
+    assert "Invalid data found" in capsys.readouterr().out
+
+
+def test_convert_file_async_kills_ffmpeg_on_cancel(tmp_path, fake_ffmpeg):
+    processes = fake_ffmpeg(stdout=b"out_time_ms=500000\n", hang=True)
+
+    async def cancel_midway():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(convert_clip(tmp_path), timeout=0.1)
+
+    asyncio.run(cancel_midway())
+
+    assert processes[0].killed
+    assert not (tmp_path / "clip.mp4").exists()
+
+
+def test_get_output_filepath_keeps_dots_in_stem(tmp_path):
+    test_file = tmp_path / "clip.v2.mov"
+    test_file.touch()
+
+    file_creation_date = get_file_creation_date(test_file)
+    result = get_output_filepath(test_file)
+
+    assert result == str(tmp_path / f"{file_creation_date}_clip.v2.mp4")
+
+
+def test_get_file_creation_date_falls_back_to_mtime(tmp_path):
+    test_file = tmp_path / "test_file.mov"
+    test_file.touch()
+    mtime = datetime(2020, 1, 2, 12, 0).timestamp()
+    os.utime(test_file, (mtime, mtime))
+
+    if hasattr(os.stat(test_file), "st_birthtime"):
+        pytest.skip("platform records file birth time")
+
+    assert get_file_creation_date(str(test_file)) == "20200102"